@@ -4,6 +4,10 @@ class Settings(BaseSettings):
     DATABASE_URL: str = "sqlite:///./crawling.db"
     BING_SEARCH_URL: str = "https://www.bing.com/search"
     LOG_LEVEL: str = "INFO"
+    CRAWL_TOP_K: int = 3
+    MAX_PAGE_BYTES: int = 5_000_000
+    STORE_RAW_HTML: bool = False
+    OUTPUT_DIR: str = "./crawled_data"
 
     class Config:
         env_file = ".env"
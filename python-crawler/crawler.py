@@ -1,172 +1,495 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
+import codecs
+import io
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import charset_normalizer
+import httpx
+from lxml import etree
 import time
 import logging
-import json
+import re
+import orjson
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
 import trafilatura
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from database import SessionLocal, Task
+from trafilatura.utils import load_html
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+from sqlalchemy import update
+from database import SessionLocal, Task, compress_blob
 from config import settings
 
 # Configure logging
 logging.basicConfig(level=getattr(logging, settings.LOG_LEVEL))
 logger = logging.getLogger(__name__)
 
+_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+SEARCH_TIMEOUT = 10
+PAGE_TIMEOUT = 15
+
+# One HTTP/2-capable httpx client per process so Bing and result pages reuse
+# pooled TCP+TLS connections, multiplexing requests to the same host on H2.
+# It is created lazily because its connections belong to the running loop.
+_client = None
+_client_loop = None
+
+def get_client():
+    """
+    Returns the process-wide httpx client, creating it on first use.
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(
+            http2=True,
+            headers=_HEADERS,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            timeout=PAGE_TIMEOUT,
+            follow_redirects=True,
+        )
+        _client_loop = loop
+    return _client
+
+async def close_client():
+    """
+    Closes the shared httpx client (called on app shutdown).
+    """
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+# Trafilatura extraction is CPU-bound, so it runs in worker processes to keep
+# the event loop free for API requests. The pool is rebuilt if a worker dies.
+_executor = None
+
+def get_executor():
+    """
+    Returns the extraction process pool, creating it on first use.
+    "spawn" avoids forking a process that already has threads (the to_thread
+    pool, DNS resolvers).
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+def shutdown_executor():
+    """
+    Stops the extraction pool (called on app shutdown).
+    """
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    _executor = None
+
+async def run_extraction(html_content):
+    """
+    Runs extract_content in the process pool. If the pool is broken (a worker
+    was killed, e.g. out of memory), it is replaced and the call retried once.
+    """
+    global _executor
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    try:
+        return await loop.run_in_executor(executor, extract_content, html_content)
+    except BrokenProcessPool:
+        logger.warning("Extraction process pool broke, starting a new one")
+        # Concurrent callers may have replaced it already
+        if _executor is executor:
+            _executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+        return await loop.run_in_executor(get_executor(), extract_content, html_content)
+
+class HostRateLimiter:
+    """
+    Per-host token bucket, keyed by URL netloc.
+    Each host refills at `refill_rate` tokens/second up to `capacity`. Rate-limit
+    headers on responses (X-RateLimit-Remaining, Retry-After) drain the bucket or
+    pause the host, so concurrent and retried requests back off together.
+    """
+    # Never honour a Retry-After longer than this (seconds)
+    MAX_RETRY_AFTER = 60
+
+    def __init__(self, capacity=8, refill_rate=4.0, max_hosts=1024):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.max_hosts = max_hosts
+        self._buckets = {}
+
+    def _bucket(self, host):
+        if host not in self._buckets:
+            if len(self._buckets) >= self.max_hosts:
+                self._evict_idle(time.monotonic())
+            self._buckets[host] = {
+                "tokens": float(self.capacity),
+                "updated": time.monotonic(),
+                "reset_at": 0.0,
+            }
+        return self._buckets[host]
+
+    def _evict_idle(self, now):
+        """
+        Drops buckets that have refilled completely and are not paused. Such a
+        bucket behaves exactly like a new one, so forgetting it changes nothing.
+        """
+        for host, bucket in list(self._buckets.items()):
+            refilled = bucket["tokens"] + (now - bucket["updated"]) * self.refill_rate
+            if refilled >= self.capacity and bucket["reset_at"] <= now:
+                del self._buckets[host]
+
+    async def acquire(self, url):
+        """
+        Waits until a request to the URL's host is allowed and takes a token.
+        """
+        host = urlparse(url).netloc
+        while True:
+            # Looked up every pass: the bucket may be evicted while we sleep
+            bucket = self._bucket(host)
+            now = time.monotonic()
+            if now < bucket["reset_at"]:
+                await asyncio.sleep(bucket["reset_at"] - now)
+                continue
+
+            elapsed = now - bucket["updated"]
+            bucket["tokens"] = min(self.capacity, bucket["tokens"] + elapsed * self.refill_rate)
+            bucket["updated"] = now
+            if bucket["tokens"] >= 1:
+                bucket["tokens"] -= 1
+                return
+            await asyncio.sleep((1 - bucket["tokens"]) / self.refill_rate)
+
+    def update(self, url, response):
+        """
+        Adjusts the host's bucket from the response's rate-limit headers.
+        """
+        bucket = self._bucket(urlparse(url).netloc)
+
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        if remaining is not None and remaining.isdigit():
+            bucket["tokens"] = min(bucket["tokens"], float(remaining))
+
+        retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is None and response.status_code in (429, 503):
+            # Rate limited without a hint: pause the host for one refill period
+            retry_after = 1 / self.refill_rate
+        if retry_after is not None:
+            retry_after = min(retry_after, self.MAX_RETRY_AFTER)
+            bucket["reset_at"] = max(bucket["reset_at"], time.monotonic() + retry_after)
+            logger.warning(f"Rate limited by {urlparse(url).netloc}, pausing for {retry_after:.1f}s")
+
+def _parse_retry_after(value):
+    """
+    Parses a Retry-After header (delta-seconds or HTTP-date) into seconds.
+    """
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _is_retryable(exc):
+    """
+    Only retry network errors, timeouts, 429 and 5xx responses.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(exc, httpx.TransportError)
+
+RATE_LIMITER = HostRateLimiter()
+
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=4, max=10),
-    retry=retry_if_exception_type(requests.RequestException)
+    retry=retry_if_exception(_is_retryable)
 )
-def search_bing(keyword):
+async def search_bing(keyword):
     """
     Searches Bing for the keyword and returns a list of results.
     Each result is a dictionary with 'title', 'link', and 'snippet'.
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-        "Accept-Language": "en-US,en;q=0.9",
-    }
-    url = f"{settings.BING_SEARCH_URL}?format=rss&q={keyword}&cc=US"
+    params = {"format": "rss", "q": keyword, "cc": "US"}
     
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        await RATE_LIMITER.acquire(settings.BING_SEARCH_URL)
+        response = await get_client().get(settings.BING_SEARCH_URL, params=params, timeout=SEARCH_TIMEOUT)
+        RATE_LIMITER.update(settings.BING_SEARCH_URL, response)
         response.raise_for_status()
-    except requests.RequestException as e:
+        content = response.content
+    except httpx.HTTPError as e:
         logger.error(f"Error searching Bing: {e}")
         raise # Re-raise for tenacity to catch
 
-    soup = BeautifulSoup(response.content, 'xml')
     results = []
     
-    # RSS items are in <item> tags
-    for item in soup.find_all('item'):
-        try:
-            title = item.title.get_text() if item.title else "No title"
-            link = item.link.get_text() if item.link else None
-            snippet = item.description.get_text() if item.description else "No snippet"
-            
-            if link:
-                results.append({
-                    "title": title,
-                    "link": link,
-                    "snippet": snippet
-                })
-        except Exception as e:
-            logger.warning(f"Error parsing result item: {e}")
-            continue
+    # RSS items are in <item> tags. Stream them so only one item is alive at a
+    # time; recover=True keeps parsing lenient when Bing serves a truncated or
+    # non-RSS page, in which case we fall through to the debug dump.
+    context = etree.iterparse(io.BytesIO(content), events=('end',), tag='item', recover=True)
+    try:
+        for _, item in context:
+            try:
+                title = item.findtext('title') or "No title"
+                link = item.findtext('link')
+                snippet = item.findtext('description') or "No snippet"
+                
+                if link:
+                    results.append({
+                        "title": title,
+                        "link": link,
+                        "snippet": snippet
+                    })
+            except Exception as e:
+                logger.warning(f"Error parsing result item: {e}")
+            finally:
+                # Free the item and any already-processed siblings
+                item.clear()
+                while item.getprevious() is not None:
+                    del item.getparent()[0]
+    except etree.XMLSyntaxError as e:
+        logger.warning(f"Error parsing Bing RSS: {e}")
             
     if not results:
         logger.warning("No results found. Saving XML to debug_bing.xml")
         with open("debug_bing.xml", "w", encoding="utf-8") as f:
-            f.write(response.text)
+            f.write(content.decode("utf-8", errors="replace"))
             
     return results
 
-    if not results:
-        logger.warning("No results found. Saving XML to debug_bing.xml")
-        with open("debug_bing.xml", "w", encoding="utf-8") as f:
-            f.write(response.text)
-            
-    return results
+async def _read_capped(response, max_bytes):
+    """
+    Streams the response body in 16KB chunks and decodes it once (see _decode_html).
+    Raises ValueError as soon as the page exceeds max_bytes.
+    """
+    content_length = response.headers.get("Content-Length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+        raise ValueError(f"Page too big: {content_length} bytes")
+
+    body = bytearray()
+    async for chunk in response.aiter_bytes(16384):
+        body.extend(chunk)
+        if len(body) > max_bytes:
+            raise ValueError(f"Page too big: over {max_bytes} bytes")
+
+    return _decode_html(bytes(body), response.charset_encoding)
+
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+
+def _decode_html(body, declared_charset=None):
+    """
+    Decodes an HTML body once, picking the encoding like a browser would: BOM,
+    Content-Type charset, <meta> charset in the first 4KB, strict UTF-8, then
+    charset_normalizer's best guess.
+    """
+    if body.startswith(codecs.BOM_UTF8):
+        return body[len(codecs.BOM_UTF8):].decode("utf-8", errors="replace")
+
+    candidates = [declared_charset]
+    match = _META_CHARSET.search(body, 0, 4096)
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+    for charset in candidates:
+        if not charset:
+            continue
+        try:
+            codec = codecs.lookup(charset).name
+        except LookupError:
+            continue
+        # Pages labelled latin-1 are windows-1252 in practice (as in the HTML spec)
+        if codec == "iso8859-1":
+            codec = "cp1252"
+        return body.decode(codec, errors="replace")
+
+    try:
+        return body.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    best = charset_normalizer.from_bytes(body).best()
+    if best is not None:
+        return str(best)
+    return body.decode("cp1252", errors="replace")
+
+def extract_content(html_content):
+    """
+    Extracts the main text and metadata from an HTML page with Trafilatura.
+    The HTML is parsed into an lxml tree once and shared by both extractors.
+    Returns a dict with 'text', 'meta_description', 'meta_author', 'meta_date'.
+    """
+    result = {
+        "text": None,
+        "meta_description": None,
+        "meta_author": None,
+        "meta_date": None
+    }
+
+    # load_html copes with encoding declarations and broken markup
+    tree = load_html(html_content)
+    if tree is None:
+        return result
+
+    # Metadata first, in the same order as trafilatura's own bare_extraction
+    metadata = trafilatura.extract_metadata(tree)
+    if metadata:
+        result["meta_description"] = metadata.description
+        result["meta_author"] = metadata.author
+        result["meta_date"] = metadata.date
+        
+    result["text"] = trafilatura.extract(
+        tree, 
+        include_comments=False, 
+        include_tables=True, 
+        with_metadata=False
+    )
+    return result
 
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=4, max=10),
-    retry=retry_if_exception_type(Exception)
+    retry=retry_if_exception(_is_retryable)
 )
-def fetch_page_content(url):
+async def fetch_page_content(url):
     """
-    Fetches the URL using requests (with headers) and extracts content + metadata using Trafilatura.
+    Fetches the URL using the shared httpx client and extracts content + metadata using Trafilatura.
     Returns a dict with 'html', 'text', 'meta_description', 'meta_author', 'meta_date'.
     """
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7",
-        "Accept-Language": "en-US,en;q=0.9",
-    }
-    
     try:
-        # 1. Fetch with requests (more reliable control over headers)
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        html_content = response.text
+        # 1. Stream with the pooled client (reuses keep-alive connections)
+        await RATE_LIMITER.acquire(url)
+        async with get_client().stream("GET", url, timeout=PAGE_TIMEOUT) as response:
+            RATE_LIMITER.update(url, response)
+            response.raise_for_status()
+            html_content = await _read_capped(response, settings.MAX_PAGE_BYTES)
         
-        result = {
-            "html": html_content,
-            "text": None,
-            "meta_description": None,
-            "meta_author": None,
-            "meta_date": None
-        }
-        
-        # 2. Extract with Trafilatura
-        # extract_metadata expects the raw HTML string
-        metadata = trafilatura.extract_metadata(html_content)
-        if metadata:
-            result["meta_description"] = metadata.description
-            result["meta_author"] = metadata.author
-            result["meta_date"] = metadata.date
-            
-        result["text"] = trafilatura.extract(
-            html_content, 
-            include_comments=False, 
-            include_tables=True, 
-            with_metadata=False
-        )
+        # 2. Extract with Trafilatura in a worker process (CPU-bound)
+        result = {"html": html_content}
+        result.update(await run_extraction(html_content))
         
         return result
     except Exception as e:
         logger.error(f"Error fetching page {url}: {e}")
         raise # Re-raise for tenacity
 
-def process_crawl_task(task_id, keyword):
+async def process_crawl_task(task_id, keyword):
     """
     Background task to perform the crawl and update the database.
+    The top CRAWL_TOP_K result pages are fetched concurrently.
     """
     logger.info(f"Starting task {task_id} for keyword: {keyword}")
     
-    db = SessionLocal()
     try:
         # 1. Search Bing
         try:
-            search_results = search_bing(keyword)
+            search_results = await search_bing(keyword)
         except Exception as e:
             logger.error(f"Search failed after retries: {e}")
             search_results = []
         
         first_page_data = None
+        extra_pages = []
         if search_results:
-            # 2. Fetch first result
-            first_url = search_results[0]['link']
-            logger.info(f"Fetching first result: {first_url}")
-            try:
-                first_page_data = fetch_page_content(first_url)
-            except Exception as e:
-                logger.error(f"Page fetch failed after retries: {e}")
-                first_page_data = {"html": f"Error fetching page: {e}"}
+            # 2. Fetch the top results concurrently
+            top_results = search_results[:settings.CRAWL_TOP_K]
+            logger.info(f"Fetching top {len(top_results)} results")
+            pages = await asyncio.gather(
+                *(fetch_page_content(result['link']) for result in top_results),
+                return_exceptions=True
+            )
+            for result, page in zip(top_results, pages):
+                if isinstance(page, BaseException):
+                    logger.error(f"Page fetch failed after retries for {result['link']}: {page}")
+
+            first_page_data = pages[0]
+            if isinstance(first_page_data, BaseException):
+                first_page_data = {"html": f"Error fetching page: {first_page_data}"}
+
+            # The other fetched pages only contribute their extracted text
+            extra_pages = [
+                {"link": result["link"], "text": page.get("text")}
+                for result, page in zip(top_results[1:], pages[1:])
+                if not isinstance(page, BaseException)
+            ]
         else:
             logger.warning("No search results found.")
         
-        # Update task in DB
-        task = db.query(Task).filter(Task.id == task_id).first()
-        if task:
-            task.status = "completed"
-            task.results_json = json.dumps(search_results)
+        # Keep the blocking DB write off the event loop
+        await asyncio.to_thread(save_task_results, task_id, search_results, first_page_data, extra_pages)
             
-            if first_page_data:
-                task.first_page_html = first_page_data.get("html")
-                task.extracted_text = first_page_data.get("text")
-                task.meta_description = first_page_data.get("meta_description")
-                task.meta_author = first_page_data.get("meta_author")
-                task.meta_date = first_page_data.get("meta_date")
-                
-            db.commit()
+    except Exception as e:
+        logger.error(f"Error processing task {task_id}: {e}")
+
+def store_html_in_db(page_data):
+    """
+    Raw HTML is only kept in the task row when STORE_RAW_HTML is set or when
+    extraction produced no text (so the HTML, or fetch error, is all we have).
+    """
+    return settings.STORE_RAW_HTML or not page_data.get("text")
+
+def archive_html(task_id, html):
+    """
+    Writes the raw HTML to {OUTPUT_DIR}/html/{task_id}.html.zst for debugging.
+    """
+    html_dir = os.path.join(settings.OUTPUT_DIR, "html")
+    try:
+        os.makedirs(html_dir, exist_ok=True)
+        with open(os.path.join(html_dir, f"{task_id}.html.zst"), "wb") as f:
+            f.write(compress_blob(html.encode()))
+    except OSError as e:
+        logger.warning(f"Could not archive HTML for task {task_id}: {e}")
+
+def task_result_values(search_results, first_page_data, extra_pages=None):
+    """
+    Builds the column values that mark a task completed with its crawl results.
+    """
+    values = {
+        "status": "completed",
+        "results_json": compress_blob(orjson.dumps(search_results)),
+        "extra_pages_json": compress_blob(orjson.dumps(extra_pages)) if extra_pages else None,
+    }
+    if first_page_data:
+        html = first_page_data.get("html")
+        values.update(
+            first_page_html=compress_blob(html.encode()) if html and store_html_in_db(first_page_data) else None,
+            extracted_text=first_page_data.get("text"),
+            meta_description=first_page_data.get("meta_description"),
+            meta_author=first_page_data.get("meta_author"),
+            meta_date=first_page_data.get("meta_date"),
+        )
+    return values
+
+def save_task_results(task_id, search_results, first_page_data, extra_pages=None):
+    """
+    Marks the task completed and stores the search results, first page data and
+    the text of the other fetched pages with a single UPDATE (no SELECT
+    round-trip) in one transaction.
+    """
+    if first_page_data and first_page_data.get("html") and not store_html_in_db(first_page_data):
+        archive_html(task_id, first_page_data["html"])
+
+    db = SessionLocal()
+    try:
+        with db.begin():
+            result = db.execute(
+                update(Task)
+                .where(Task.id == task_id)
+                .values(**task_result_values(search_results, first_page_data, extra_pages))
+            )
+        if result.rowcount:
             logger.info(f"Task {task_id} completed and saved to DB.")
         else:
             logger.error(f"Task {task_id} not found in DB.")
-            
-    except Exception as e:
-        logger.error(f"Error processing task {task_id}: {e}")
     finally:
         db.close()
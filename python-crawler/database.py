@@ -1,25 +1,69 @@
-from sqlalchemy import create_engine, Column, String, Integer, Text, DateTime
+from sqlalchemy import create_engine, event, inspect, text, update, Column, String, Integer, Text, DateTime, LargeBinary, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from datetime import datetime
+import zstandard
 from config import settings
 
-engine = create_engine(settings.DATABASE_URL, connect_args={"check_same_thread": False})
+# Explicit QueuePool so FastAPI requests reuse pooled, already-configured
+# SQLite connections instead of opening a new one per Depends(get_db)
+_engine_options = dict(
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=10,
+    max_overflow=20,
+    pool_pre_ping=False,
+)
+
+engine = create_engine(settings.DATABASE_URL, **_engine_options)
+# Separate pool for the status-poll endpoint so reads never queue behind
+# (or take) the writer's connections
+read_engine = create_engine(settings.DATABASE_URL, **_engine_options)
+
+@event.listens_for(engine, "connect")
+@event.listens_for(read_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL lets the status polls read while a crawl commits; NORMAL sync skips
+    the per-commit fsync of the main DB file, which is still safe under WAL.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-65536")
+    cursor.close()
+
+@event.listens_for(read_engine, "connect")
+def set_query_only(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA query_only=1")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 
 Base = declarative_base()
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Queue-style scans: WHERE status = ? [ORDER BY created_at]
+        Index("ix_tasks_status_created", "status", "created_at"),
+    )
 
     id = Column(String, primary_key=True, index=True)
     keyword = Column(String, index=True)
     status = Column(String, default="processing")
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    # Storing results as JSON string for simplicity in SQLite
-    results_json = Column(Text, nullable=True)
-    first_page_html = Column(Text, nullable=True)
+    # Stored zstd-compressed (see compress_blob); results_json holds UTF-8 JSON
+    results_json = Column(LargeBinary, nullable=True)
+    first_page_html = Column(LargeBinary, nullable=True)
+    # [{"link", "text"}] for the fetched results after the first (CRAWL_TOP_K)
+    extra_pages_json = Column(LargeBinary, nullable=True)
     
     # New fields for high-quality extraction
     extracted_text = Column(Text, nullable=True)
@@ -27,8 +71,40 @@ class Task(Base):
     meta_author = Column(String, nullable=True)
     meta_date = Column(String, nullable=True)
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
+def compress_blob(data):
+    """
+    zstd-compresses bytes for storage in a LargeBinary column.
+    """
+    return zstandard.ZstdCompressor(level=3).compress(data)
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def decompress_blob(blob):
+    """
+    Reverses compress_blob. Returns None for NULL columns.
+    Rows written before compression (TEXT, read back as str, or bytes without
+    the zstd frame magic) are returned unchanged as UTF-8 bytes.
+    """
+    if blob is None:
+        return None
+    if isinstance(blob, str):
+        return blob.encode("utf-8")
+    if not blob.startswith(ZSTD_MAGIC):
+        return bytes(blob)
+    return zstandard.ZstdDecompressor().decompress(blob)
+
+def init_db(bind=engine):
+    Base.metadata.create_all(bind=bind)
+    # create_all does not add columns to a table that already exists
+    existing = {column["name"] for column in inspect(bind).get_columns(Task.__tablename__)}
+    with bind.begin() as conn:
+        for column in Task.__table__.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=bind.dialect)
+                conn.execute(text(f"ALTER TABLE {Task.__tablename__} ADD COLUMN {column.name} {column_type}"))
+    # create_all skips indexes on tables that already exist
+    for index in Task.__table__.indexes:
+        index.create(bind=bind, checkfirst=True)
 
 def get_db():
     db = SessionLocal()
@@ -36,3 +112,28 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    """
+    Like get_db, but the session's connection is read-only (PRAGMA query_only).
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def bulk_update_tasks(db, rows):
+    """
+    Updates many tasks in one transaction via a single executemany UPDATE.
+    Each row is a dict of Task column values and must include the task "id".
+    Commits the session's current transaction if one was already begun.
+    """
+    if not rows:
+        return
+    if db.in_transaction():
+        db.execute(update(Task), rows)
+        db.commit()
+    else:
+        with db.begin():
+            db.execute(update(Task), rows)
@@ -1,53 +1,113 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import threading
+import time
 import uuid
-import json
+import orjson
 from sqlalchemy.orm import Session
-from crawler import process_crawl_task
-from database import init_db, get_db, Task
+from crawler import process_crawl_task, close_client, shutdown_executor
+from database import init_db, get_db, get_read_db, Task, decompress_blob
 import ml_api
 
-app = FastAPI(docs_url="/docs", redoc_url=None)
+# Strong references to running crawl tasks so they aren't garbage-collected
+_crawl_tasks = set()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await close_client()
+    shutdown_executor()
+
+app = FastAPI(docs_url="/docs", redoc_url=None, lifespan=lifespan, default_response_class=ORJSONResponse)
 app.include_router(ml_api.router)
 
 # Initialize DB on startup
 init_db()
 
+# (timestamp_ms, counter) of the last fallback UUIDv7, to keep ids monotonic
+_last_uuid7 = (0, 0)
+_uuid7_lock = threading.Lock()
+
+def new_task_id():
+    """
+    Returns a UUIDv7 string: a 48-bit millisecond timestamp followed by random
+    bits, so new task ids append to the right edge of the primary-key B-tree
+    instead of landing on random pages like uuid4 does. Ids are monotonic: within
+    one millisecond the 12-bit rand_a field acts as a counter (RFC 9562, method 1).
+    """
+    if hasattr(uuid, "uuid7"):  # Python 3.14+, monotonic as well
+        return str(uuid.uuid7())
+
+    global _last_uuid7
+    rand = int.from_bytes(os.urandom(10), "big")
+    with _uuid7_lock:
+        timestamp_ms = time.time_ns() // 1_000_000
+        last_ms, last_counter = _last_uuid7
+        if timestamp_ms > last_ms:
+            counter = rand >> 69                # random 11-bit start, leaves headroom
+        else:
+            # Same millisecond (or the clock stepped back): count up
+            timestamp_ms, counter = last_ms, last_counter + 1
+            if counter > 0xFFF:
+                timestamp_ms, counter = timestamp_ms + 1, 0
+        _last_uuid7 = (timestamp_ms, counter)
+
+    value = (timestamp_ms & (2**48 - 1)) << 80
+    value |= 0x7 << 76                      # version 7
+    value |= counter << 64                  # rand_a (12 bits), used as counter
+    value |= 0b10 << 62                     # RFC 4122 variant
+    value |= rand & (2**62 - 1)             # rand_b (62 bits)
+    return str(uuid.UUID(int=value))
+
 class CrawlRequest(BaseModel):
     keyword: str
 
+def create_task_record(db: Session, task_id: str, keyword: str):
+    new_task = Task(id=task_id, keyword=keyword, status="processing")
+    db.add(new_task)
+    db.commit()
+
 @app.post("/crawl")
-async def trigger_crawl(request: CrawlRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def trigger_crawl(request: CrawlRequest, db: Session = Depends(get_db)):
     """
     Triggers a background crawl task for the given keyword.
     Returns a task_id to poll for results.
     """
-    task_id = str(uuid.uuid4())
+    task_id = new_task_id()
     
-    # Create initial task record
-    new_task = Task(id=task_id, keyword=request.keyword, status="processing")
-    db.add(new_task)
-    db.commit()
+    # Create initial task record off the event loop, which also runs the crawls
+    await asyncio.to_thread(create_task_record, db, task_id, request.keyword)
     
-    background_tasks.add_task(process_crawl_task, task_id, request.keyword)
+    crawl = asyncio.create_task(process_crawl_task(task_id, request.keyword))
+    _crawl_tasks.add(crawl)
+    crawl.add_done_callback(_crawl_tasks.discard)
     return {"task_id": task_id, "message": "Crawl started"}
 
+# Plain def: FastAPI runs it in its threadpool, so the blocking DB read never
+# stalls the event loop the crawls run on
 @app.get("/crawl/{task_id}")
-async def get_crawl_status(task_id: str, db: Session = Depends(get_db)):
+def get_crawl_status(task_id: str, db: Session = Depends(get_read_db)):
     """
     Returns the status and results of a crawl task.
     """
-    task = db.query(Task).filter(Task.id == task_id).first()
+    # Primary-key lookup: checks the identity map, then a cached PK SELECT
+    task = db.get(Task, task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
     
+    results = orjson.loads(decompress_blob(task.results_json)) if task.results_json else []
+    extra_pages = orjson.loads(decompress_blob(task.extra_pages_json)) if task.extra_pages_json else []
     response = {
         "status": task.status,
         "keyword": task.keyword,
         "created_at": task.created_at,
-        "results": json.loads(task.results_json) if task.results_json else [],
-        "results": json.loads(task.results_json) if task.results_json else [],
-        "first_page_html": task.first_page_html,
+        "results": results,
+        "extra_pages": extra_pages,
+        "first_page_html": decompress_blob(task.first_page_html).decode() if task.first_page_html else None,
         "extracted_text": task.extracted_text,
         "meta_description": task.meta_description,
         "meta_author": task.meta_author,
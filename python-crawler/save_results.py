@@ -1,6 +1,6 @@
 import requests
 import time
-import json
+import orjson
 import csv
 from datetime import datetime
 import os
@@ -20,8 +20,8 @@ def save_data(data, keyword):
 
     # 1. Save Full JSON (Raw Data)
     json_filename = f"{base_filename}.json"
-    with open(json_filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    with open(json_filename, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
     print(f"✅ Saved full JSON to: {json_filename}")
 
     # 2. Save Summary to CSV (Excel compatible)
@@ -29,8 +29,10 @@ def save_data(data, keyword):
     with open(csv_filename, "w", newline="", encoding="utf-8") as f:
         writer = csv.writer(f)
         writer.writerow(["Title", "Link", "Snippet"])
-        for result in data.get("results", []):
-            writer.writerow([result.get("title"), result.get("link"), result.get("snippet")])
+        writer.writerows(
+            (result.get("title"), result.get("link"), result.get("snippet"))
+            for result in data.get("results", [])
+        )
     print(f"✅ Saved summary CSV to: {csv_filename}")
 
     # 3. Save Extracted Text (Readable Content)
@@ -1,8 +1,11 @@
+import json
+import time
+import uuid
 from fastapi.testclient import TestClient
-from main import app
-from database import Base, engine, get_db
+from main import app, new_task_id
+from database import Base, engine, get_db, get_read_db, init_db
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.pool import StaticPool
 
 # Setup in-memory SQLite for testing
@@ -24,6 +27,7 @@ def override_get_db():
         db.close()
 
 app.dependency_overrides[get_db] = override_get_db
+app.dependency_overrides[get_read_db] = override_get_db
 
 client = TestClient(app)
 
@@ -42,3 +46,60 @@ def test_get_crawl_status_not_found():
     response = client.get("/crawl/nonexistent-id")
     assert response.status_code == 404
     assert response.json()["detail"] == "Task not found"
+
+def test_get_crawl_status_reads_legacy_text_row(tmp_path, monkeypatch):
+    # A tasks table as created before results were compressed into BLOBs
+    legacy_engine = create_engine(
+        f"sqlite:///{tmp_path / 'legacy.db'}",
+        connect_args={"check_same_thread": False}
+    )
+    with legacy_engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE tasks (id VARCHAR NOT NULL, keyword VARCHAR, status VARCHAR, "
+            "created_at DATETIME, results_json TEXT, first_page_html TEXT, extracted_text TEXT, "
+            "meta_description TEXT, meta_author VARCHAR, meta_date VARCHAR, PRIMARY KEY (id))"
+        ))
+        conn.execute(
+            text("INSERT INTO tasks (id, keyword, status, created_at, results_json, first_page_html, extracted_text) "
+                 "VALUES (:id, 'legacy', 'completed', '2025-01-01 10:00:00.000000', :results, :html, 'Café text')"),
+            {
+                "id": "legacy-task",
+                "results": json.dumps([{"title": "Café", "link": "https://example.com", "snippet": "Old row"}]),
+                "html": "<html><body>Café</body></html>",
+            }
+        )
+    init_db(bind=legacy_engine)
+    LegacySessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=legacy_engine)
+
+    def override_get_legacy_db():
+        db = LegacySessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    monkeypatch.setitem(app.dependency_overrides, get_read_db, override_get_legacy_db)
+    response = client.get("/crawl/legacy-task")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["results"] == [{"title": "Café", "link": "https://example.com", "snippet": "Old row"}]
+    assert data["first_page_html"] == "<html><body>Café</body></html>"
+    assert data["extracted_text"] == "Café text"
+    assert data["extra_pages"] == []
+
+def test_new_task_id_is_uuid7():
+    task_id = uuid.UUID(new_task_id())
+    assert task_id.version == 7
+    assert task_id.variant == uuid.RFC_4122
+
+def test_new_task_ids_sort_by_creation_time():
+    first = new_task_id()
+    time.sleep(0.002)
+    second = new_task_id()
+    assert first < second
+
+def test_new_task_ids_are_monotonic_within_a_millisecond():
+    ids = [new_task_id() for _ in range(5000)]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
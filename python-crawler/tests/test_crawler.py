@@ -0,0 +1,209 @@
+import asyncio
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import httpx
+import pytest
+import crawler
+
+RSS = b"""<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0">
+  <channel>
+    <title>Bing: test travel</title>
+    <item>
+      <title>First result</title>
+      <link>https://example.com/1</link>
+      <description>First snippet</description>
+    </item>
+    <item>
+      <link>https://example.com/2</link>
+    </item>
+    <item>
+      <title>No link, skipped</title>
+      <description>Ignored</description>
+    </item>
+  </channel>
+</rss>"""
+
+CAPTCHA_HTML = b"""<!DOCTYPE html>
+<html><head><title>Verify</title><script>if (a < b) { go(); }</script></head>
+<body><form action="/challenge"><input name="captcha"></form></body></html>"""
+
+def use_transport(monkeypatch, handler):
+    """
+    Routes the crawler's shared httpx client through a MockTransport.
+    """
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(crawler, "get_client", lambda: client)
+    return client
+
+def test_search_bing_parses_rss_items(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    requests_seen = []
+
+    def handler(request):
+        requests_seen.append(request)
+        return httpx.Response(200, content=RSS)
+
+    use_transport(monkeypatch, handler)
+    results = asyncio.run(crawler.search_bing("test travel"))
+
+    assert results == [
+        {"title": "First result", "link": "https://example.com/1", "snippet": "First snippet"},
+        {"title": "No title", "link": "https://example.com/2", "snippet": "No snippet"},
+    ]
+    assert requests_seen[0].url.params["q"] == "test travel"
+    assert requests_seen[0].url.params["format"] == "rss"
+    assert not (tmp_path / "debug_bing.xml").exists()
+
+@pytest.mark.parametrize("body", [b"", CAPTCHA_HTML], ids=["empty", "captcha-html"])
+def test_search_bing_without_items_returns_empty_and_dumps_body(monkeypatch, tmp_path, body):
+    monkeypatch.chdir(tmp_path)
+    use_transport(monkeypatch, lambda request: httpx.Response(200, content=body))
+
+    results = asyncio.run(crawler.search_bing("test travel"))
+
+    assert results == []
+    assert (tmp_path / "debug_bing.xml").read_bytes() == body
+
+def test_process_crawl_task_keeps_result_shape(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    page = b"<html><body><article><p>" + b"Travel tips for the curious. " * 40 + b"</p></article></body></html>"
+
+    def handler(request):
+        if request.url.host == "www.bing.com":
+            return httpx.Response(200, content=RSS)
+        return httpx.Response(200, content=page, headers={"Content-Type": "text/html; charset=utf-8"})
+
+    use_transport(monkeypatch, handler)
+    monkeypatch.setattr(crawler, "get_executor", lambda: ThreadPoolExecutor(max_workers=1))
+    saved = {}
+    monkeypatch.setattr(crawler, "save_task_results", lambda *args: saved.setdefault("args", args))
+
+    asyncio.run(crawler.process_crawl_task("task-1", "test travel"))
+
+    task_id, search_results, first_page_data, extra_pages = saved["args"]
+    assert task_id == "task-1"
+    # results[] keeps the title/link/snippet shape; page text lives elsewhere
+    assert all(set(result) == {"title", "link", "snippet"} for result in search_results)
+    assert first_page_data["text"]
+    assert [page["link"] for page in extra_pages] == ["https://example.com/2"]
+    assert extra_pages[0]["text"]
+
+def test_parse_retry_after_delta_seconds():
+    assert crawler._parse_retry_after("120") == 120.0
+
+def test_parse_retry_after_http_date():
+    when = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 <= crawler._parse_retry_after(when) <= 31
+
+@pytest.mark.parametrize("value", [None, "", "soon", "Mon, 99 Foo 20xx"])
+def test_parse_retry_after_garbage(value):
+    assert crawler._parse_retry_after(value) is None
+
+@pytest.mark.parametrize("status, expected", [(404, False), (429, True), (503, True)])
+def test_is_retryable_status(status, expected):
+    request = httpx.Request("GET", "https://example.com/")
+    response = httpx.Response(status, request=request)
+    error = httpx.HTTPStatusError("error", request=request, response=response)
+    assert crawler._is_retryable(error) is expected
+
+def test_is_retryable_network_errors_only():
+    assert crawler._is_retryable(httpx.ConnectError("refused"))
+    assert not crawler._is_retryable(ValueError("Page too big"))
+
+def test_retry_after_pauses_acquire():
+    limiter = crawler.HostRateLimiter()
+    limiter.MAX_RETRY_AFTER = 0.2  # caps the server's Retry-After: 5
+    limiter.update("https://slow.example/a", httpx.Response(429, headers={"Retry-After": "5"}))
+
+    start = time.monotonic()
+    asyncio.run(limiter.acquire("https://other.example/"))
+    assert time.monotonic() - start < 0.1
+
+    start = time.monotonic()
+    asyncio.run(limiter.acquire("https://slow.example/b"))
+    assert 0.15 <= time.monotonic() - start < 1
+
+def test_idle_buckets_are_evicted():
+    limiter = crawler.HostRateLimiter(refill_rate=1000.0, max_hosts=2)
+    limiter.update("https://paused.example/", httpx.Response(429, headers={"Retry-After": "30"}))
+    asyncio.run(limiter.acquire("https://idle.example/"))
+    time.sleep(0.01)  # idle.example refills completely
+
+    asyncio.run(limiter.acquire("https://new.example/"))
+
+    assert set(limiter._buckets) == {"paused.example", "new.example"}
+
+class BrokenExecutor(Executor):
+    """
+    Stands in for a process pool whose worker was killed.
+    """
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_exception(BrokenProcessPool("worker died"))
+        return future
+
+    def shutdown(self, wait=True, **kwargs):
+        self.shut_down = True
+
+def test_run_extraction_replaces_a_broken_pool(monkeypatch):
+    broken = BrokenExecutor()
+    monkeypatch.setattr(crawler, "_executor", broken)
+    # The replacement pool: threads are enough to show the retry succeeds
+    monkeypatch.setattr(crawler, "ProcessPoolExecutor", lambda **kwargs: ThreadPoolExecutor(max_workers=1))
+    html = "<html><body><article><p>" + "Recovered text for the page. " * 40 + "</p></article></body></html>"
+
+    result = asyncio.run(crawler.run_extraction(html))
+
+    assert "Recovered text" in result["text"]
+    assert broken.shut_down
+    assert isinstance(crawler.get_executor(), ThreadPoolExecutor)
+
+def test_fetch_page_content_uses_meta_charset(monkeypatch):
+    body = (
+        '<html><head><meta charset="windows-1252"><title>Café</title></head>'
+        '<body><article><p>' + 'Café naïve résumé for the curious traveller. ' * 20 + '</p></article></body></html>'
+    ).encode("cp1252")
+    use_transport(monkeypatch, lambda request: httpx.Response(200, content=body, headers={"Content-Type": "text/html"}))
+    monkeypatch.setattr(crawler, "get_executor", lambda: ThreadPoolExecutor(max_workers=1))
+
+    result = asyncio.run(crawler.fetch_page_content("https://example.com/cafe"))
+
+    assert "Café naïve résumé" in result["html"]
+    assert "Café naïve résumé" in result["text"]
+    assert "�" not in result["html"]
+
+def test_fetch_page_content_rejects_oversized_content_length(monkeypatch):
+    monkeypatch.setattr(crawler.settings, "MAX_PAGE_BYTES", 1000)
+    # Content-Length is set from the bytes body
+    use_transport(monkeypatch, lambda request: httpx.Response(200, content=b"x" * 1001))
+
+    with pytest.raises(ValueError, match="Page too big"):
+        asyncio.run(crawler.fetch_page_content("https://example.com/big"))
+
+def test_fetch_page_content_aborts_oversized_stream(monkeypatch):
+    monkeypatch.setattr(crawler.settings, "MAX_PAGE_BYTES", 50_000)
+    chunks_sent = []
+
+    async def chunks():
+        for _ in range(100):
+            chunks_sent.append(1)
+            yield b"x" * 16384
+
+    def handler(request):
+        response = httpx.Response(200, content=chunks())
+        assert "Content-Length" not in response.headers
+        return response
+
+    use_transport(monkeypatch, handler)
+
+    with pytest.raises(ValueError, match="Page too big"):
+        asyncio.run(crawler.fetch_page_content("https://example.com/endless"))
+    # Stopped reading soon after crossing the limit
+    assert len(chunks_sent) < 10
@@ -0,0 +1,65 @@
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from database import Base, Task, bulk_update_tasks, compress_blob, decompress_blob
+
+engine = create_engine(
+    "sqlite:///:memory:",
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool
+)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+Base.metadata.create_all(bind=engine)
+
+def add_tasks(*task_ids):
+    db = TestingSessionLocal()
+    try:
+        db.add_all(Task(id=task_id, keyword="bulk", status="processing") for task_id in task_ids)
+        db.commit()
+    finally:
+        db.close()
+
+def test_bulk_update_tasks_updates_each_row():
+    add_tasks("bulk-1", "bulk-2", "bulk-3")
+    db = TestingSessionLocal()
+    try:
+        bulk_update_tasks(db, [
+            {"id": "bulk-1", "status": "completed", "extracted_text": "one"},
+            {"id": "bulk-2", "status": "failed", "extracted_text": "two"},
+        ])
+
+        assert db.get(Task, "bulk-1").status == "completed"
+        assert db.get(Task, "bulk-1").extracted_text == "one"
+        assert db.get(Task, "bulk-2").status == "failed"
+        assert db.get(Task, "bulk-3").status == "processing"
+        # Untouched columns survive the update
+        assert db.get(Task, "bulk-2").keyword == "bulk"
+    finally:
+        db.close()
+
+def test_bulk_update_tasks_after_a_query_on_the_session():
+    add_tasks("bulk-4", "bulk-5")
+    db = TestingSessionLocal()
+    try:
+        assert db.get(Task, "bulk-4").status == "processing"  # begins a transaction
+
+        bulk_update_tasks(db, [
+            {"id": "bulk-4", "status": "completed"},
+            {"id": "bulk-5", "status": "completed"},
+        ])
+    finally:
+        db.close()
+
+    db = TestingSessionLocal()
+    try:
+        assert db.get(Task, "bulk-4").status == "completed"
+        assert db.get(Task, "bulk-5").status == "completed"
+    finally:
+        db.close()
+
+def test_decompress_blob_round_trips_and_passes_legacy_values_through():
+    assert decompress_blob(compress_blob(b'{"a": 1}')) == b'{"a": 1}'
+    assert decompress_blob('[{"title": "Café"}]') == '[{"title": "Café"}]'.encode()
+    assert decompress_blob(b"<html></html>") == b"<html></html>"
+    assert decompress_blob(None) is None